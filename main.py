@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import plotly.express as px
 import numpy as np
+import hashlib
 import io
+import os
+import tempfile
 
 # --- 1. Mapeamento de Colunas (Ajustado para o seu CSV) ---
 
@@ -36,14 +42,34 @@ COLUNAS_ESSENCIAIS = [
     'Prioridade 1', 'Prioridade 2', 'Prioridade 3'
 ]
 
+# Nomes originais (do formulário) das colunas essenciais: só elas são lidas do arquivo
+COLUNAS_LIDAS = [coluna for coluna, chave in COLUNA_MAPPER.items() if chave in COLUNAS_ESSENCIAIS]
+
+# Colunas de prioridade empilhadas na coluna 'Prioridade' (também a ordem de exibição no gráfico)
+PRIORIDADES = ['Prioridade 1', 'Prioridade 2', 'Prioridade 3']
+
+# Pasta do cache em disco (Parquet) dos arquivos já processados, ao lado deste script
+# (não depende do diretório de onde o app foi iniciado)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+# Versão do formato dos DataFrames processados; incrementar ao mudar o process_data invalida o cache em disco
+CACHE_VERSION = 3
+# Máximo de arquivos processados mantidos no cache em disco (os usados há mais tempo são apagados)
+CACHE_MAX_ARQUIVOS = 20
+# Máximo de figuras do Plotly em cache por gráfico: o cache de recursos é global do processo e não expira
+FIGURAS_EM_CACHE = 64
+
+# Motivos genéricos que não entram na análise de motivações (ajustado para termos em português)
+# Casamento por prefixo e sem diferenciar maiúsculas, o que também cobre os textos de pergunta/exemplo
+# do formulário que às vezes aparecem como resposta
+MOTIVOS_EXCLUIR_RE = r'(?i)^(outros?$|não tenho interesse|há outros fatores|opcional\. ex:)'
+
 
-@st.cache_data
 def process_data(df_raw):
-    """Realiza o pré-processamento de melt e explode nos dados."""
+    """Realiza o pré-processamento de melt e explode nos dados (em uma consulta lazy do Polars)."""
     
     # 1. Renomeia as colunas longas para as chaves curtas
-    # Usa errors='ignore' para ignorar colunas que não estão no mapeamento (ex: Observações)
-    df_raw = df_raw.rename(columns=COLUNA_MAPPER, errors='ignore')
+    # Só mapeia as colunas presentes, ignorando as que não estão no mapeamento (ex: Observações)
+    df_raw = df_raw.rename({k: v for k, v in COLUNA_MAPPER.items() if k in df_raw.columns})
     
     # Verifica se todas as colunas essenciais estão presentes
     if not all(col in df_raw.columns for col in COLUNAS_ESSENCIAIS):
@@ -51,22 +77,349 @@ def process_data(df_raw):
         st.error(f"Erro no mapeamento. As colunas essenciais estão faltando: {missing}. Verifique o COLUNA_MAPPER.")
         return pd.DataFrame(), pd.DataFrame()
 
+    # O restante é uma consulta lazy: o Polars otimiza o plano inteiro e só materializa no collect
+    # Mantém apenas as colunas usadas na análise: os textos longos (Observações, Sinceridade etc.)
+    # não passam pelo cast, pelo unpivot nem pela conversão para pandas
+    lf_raw = df_raw.lazy().select(COLUNAS_ESSENCIAIS)
+
+    # Colunas de baixa cardinalidade viram categóricas (groupby/filtros operam sobre códigos inteiros);
+    # passam antes por texto, pois o Polars não converte inteiros (ex: cursos em códigos 0/1/2) em Categorical
+    # A matrícula é um campo livre do formulário (pode ter texto): vira texto, seja qual for o tipo lido
+    lf_raw = lf_raw.with_columns(
+        pl.col('Curso', 'Disponibilidade', 'Motivacao', 'Prioridade 1', 'Prioridade 2', 'Prioridade 3').cast(pl.String).cast(pl.Categorical),
+        pl.col('Matricula').cast(pl.String)
+    )
 
     # 2. Função para empilhar as prioridades (P1, P2, P3) em uma única coluna 'Disciplina'
-    df_consolidado = pd.melt(
-        df_raw,
+    lf_consolidado = lf_raw.unpivot(
         # Mantém as colunas de contexto
-        id_vars=['Curso', 'Disponibilidade', 'Motivacao', 'Matricula'], 
+        index=['Curso', 'Disponibilidade', 'Motivacao', 'Matricula'], 
         # Colunas a serem empilhadas
-        value_vars=['Prioridade 1', 'Prioridade 2', 'Prioridade 3'], 
-        var_name='Prioridade',
+        on=PRIORIDADES, 
+        variable_name='Prioridade',
         value_name='Disciplina'
     )
     
-    # 3. Remove linhas onde a disciplina é NaN/vazia (se o aluno não preencheu as 3 prioridades)
-    df_consolidado = df_consolidado.dropna(subset=['Disciplina'])
+    # 3. Remove linhas onde a disciplina é nula/vazia (se o aluno não preencheu as 3 prioridades)
+    # 'Prioridade' tem valores conhecidos de antemão: Enum com categorias fixas (e ordenadas)
+    lf_consolidado = lf_consolidado.drop_nulls('Disciplina').with_columns(
+        pl.col('Prioridade').cast(pl.Enum(PRIORIDADES)),
+        pl.col('Disciplina').cast(pl.Categorical)
+    )
+
+    # Executa as duas consultas juntas, compartilhando a parte comum do plano (select + cast)
+    df_raw, df_consolidado = pl.collect_all([lf_raw, lf_consolidado])
     
-    return df_raw, df_consolidado
+    # Converte para pandas apenas na saída, para compatibilidade com Streamlit/Plotly
+    return df_raw.to_pandas(), df_consolidado.to_pandas()
+
+
+def decode_invalid_utf8(table):
+    """Converte as colunas binárias (utf-8 com bytes inválidos) em texto, substituindo esses bytes."""
+    for i, campo in enumerate(table.schema):
+        if pa.types.is_binary(campo.type):
+            valores = [v if v is None else v.decode('utf-8', errors='replace') for v in table.column(i).to_pylist()]
+            table = table.set_column(i, campo.name, pa.array(valores, pa.string()))
+    return table
+
+
+def read_upload(file_bytes, filename):
+    """Lê o arquivo carregado (CSV ou Excel) em um DataFrame Polars."""
+    if filename.endswith('.csv'):
+        # Tenta detectar o separador (vírgula ou ponto e vírgula) contando bytes
+        # apenas no início do arquivo, sem decodificar o conteúdo
+        head = file_bytes[:65536]
+        separator = b',' if head.count(b',') > head.count(b';') else b';'
+        
+        # Lê direto dos bytes com o leitor multithread do pyarrow, que já entrega uma tabela Arrow
+        # (o pl.from_arrow a reaproveita sem cópia); strings vazias viram nulas, como no pandas.
+        # Só as colunas essenciais são lidas: os textos longos (Observações etc.) nem são convertidos.
+        # newlines_in_values: respostas (e o cabeçalho de Observações) têm quebras de linha entre aspas;
+        # sem isso, o pyarrow corta os blocos de leitura no meio de um valor em arquivos maiores
+        parse_options = pacsv.ParseOptions(delimiter=separator.decode(), newlines_in_values=True)
+        projected_options = pacsv.ConvertOptions(strings_can_be_null=True, include_columns=COLUNAS_LIDAS)
+        all_options = pacsv.ConvertOptions(strings_can_be_null=True)
+        table = None
+        # Primeira leitura que encontrou o cabeçalho mas teve valores com bytes inválidos
+        table_invalida = None
+        for encoding in ('utf8', 'latin1'):
+            try:
+                candidate = pacsv.read_csv(
+                    io.BytesIO(file_bytes),
+                    read_options=pacsv.ReadOptions(encoding=encoding),
+                    parse_options=parse_options,
+                    convert_options=projected_options
+                )
+            except pa.ArrowKeyError:
+                # Alguma coluna essencial não foi encontrada no cabeçalho (ex: acentos de um arquivo latin-1)
+                continue
+            # Se o arquivo não for utf-8, o pyarrow não falha: as colunas saem binárias. Nesse caso relê
+            # como latin-1, que o pyarrow transcodifica durante a leitura
+            if not any(pa.types.is_binary(campo.type) for campo in candidate.schema):
+                table = candidate
+                break
+            if table_invalida is None:
+                table_invalida = candidate
+
+        if table is None and table_invalida is not None:
+            # Cabeçalho em utf-8, mas alguma resposta tem um byte inválido
+            table = decode_invalid_utf8(table_invalida)
+
+        if table is None:
+            # Falta alguma coluna essencial: lê todas as colunas, para o process_data apontar quais faltam.
+            # O encoding vem do cabeçalho (a primeira linha tem os acentos dos nomes das colunas): se não for
+            # utf-8 válido, lê como latin-1, que decodifica qualquer byte
+            try:
+                file_bytes.split(b'\n', 1)[0].decode('utf-8')
+                encoding = 'utf8'
+            except UnicodeDecodeError:
+                encoding = 'latin1'
+            table = pacsv.read_csv(
+                io.BytesIO(file_bytes),
+                read_options=pacsv.ReadOptions(encoding=encoding),
+                parse_options=parse_options,
+                convert_options=all_options
+            )
+            # Um arquivo utf-8 ainda pode ter bytes inválidos nos valores
+            table = decode_invalid_utf8(table)
+        df_load = pl.from_arrow(table)
+            
+    else: # Assumindo xlsx
+        # Usa o leitor calamine (em Rust); sem o python-calamine instalado (ImportError) ou com um pandas
+        # sem esse engine (< 2.2, ValueError), volta ao openpyxl
+        # Todas as células são lidas como texto em Arrow ('string[pyarrow]'): o pl.from_pandas não copia
+        # strings, e uma coluna com números e texto misturados (ex: "não lembro" na matrícula) não quebra
+        # a leitura, como acontece com dtype_backend='pyarrow', que tenta converter a coluna inteira para int
+        # Só as colunas essenciais são lidas (as que faltarem são apontadas pelo process_data)
+        excel_options = dict(usecols=lambda coluna: coluna in COLUNAS_LIDAS, dtype='string[pyarrow]')
+        try:
+            df_excel = pd.read_excel(io.BytesIO(file_bytes), engine='calamine', **excel_options)
+        except (ImportError, ValueError):
+            df_excel = pd.read_excel(io.BytesIO(file_bytes), engine='openpyxl', **excel_options)
+        df_load = pl.from_pandas(df_excel)
+        
+    return df_load
+
+
+def file_key(file_bytes):
+    """Chave do conteúdo de um arquivo: versão do formato processado + SHA-256 dos bytes."""
+    return f'v{CACHE_VERSION}_{hashlib.sha256(file_bytes).hexdigest()}'
+
+
+def prune_disk_cache():
+    """Apaga do cache em disco os arquivos processados além dos CACHE_MAX_ARQUIVOS usados mais recentemente."""
+    # Cada arquivo processado tem dois Parquet ({chave}_raw e {chave}_consolidado); a data de uso é
+    # a modificação mais recente entre os dois (a leitura do cache também atualiza essa data)
+    uso_por_chave = {}
+    for nome in os.listdir(CACHE_DIR):
+        if nome.endswith('.parquet'):
+            chave = nome.rsplit('_', 1)[0]
+            try:
+                mtime = os.path.getmtime(os.path.join(CACHE_DIR, nome))
+            except FileNotFoundError:
+                continue
+            uso_por_chave[chave] = max(uso_por_chave.get(chave, mtime), mtime)
+
+    antigas = sorted(uso_por_chave, key=uso_por_chave.get, reverse=True)[CACHE_MAX_ARQUIVOS:]
+    for chave in antigas:
+        for sufixo in ('_raw.parquet', '_consolidado.parquet'):
+            try:
+                os.remove(os.path.join(CACHE_DIR, f'{chave}{sufixo}'))
+            except FileNotFoundError:
+                # Outro processo já apagou (ou o par estava incompleto)
+                pass
+
+
+@st.cache_data
+def load_and_process(file_bytes, filename):
+    """Lê o arquivo carregado e aplica o pré-processamento, com cache em memória e em disco.
+
+    O cache é indexado pelos bytes do arquivo, então reenviar o mesmo arquivo não repete a leitura.
+    Os DataFrames processados também são gravados em Parquet, e sobrevivem a um reinício do app.
+    Retorna também a chave do arquivo (ver file_key), guardada no cache junto com os DataFrames.
+    """
+    chave = file_key(file_bytes)
+    raw_path = os.path.join(CACHE_DIR, f'{chave}_raw.parquet')
+    consolidado_path = os.path.join(CACHE_DIR, f'{chave}_consolidado.parquet')
+
+    if os.path.exists(raw_path) and os.path.exists(consolidado_path):
+        try:
+            df_raw, df_consolidado = pd.read_parquet(raw_path), pd.read_parquet(consolidado_path)
+        except (OSError, ValueError, pa.ArrowException):
+            # Parquet corrompido ou sem permissão de leitura: ignora o cache e processa o arquivo de novo
+            # (a gravação abaixo substitui os arquivos com problema)
+            pass
+        else:
+            try:
+                # Marca o arquivo como usado agora, para a limpeza do cache manter os mais recentes
+                os.utime(raw_path)
+            except OSError:
+                pass
+            return df_raw, df_consolidado, chave
+
+    df_raw, df_consolidado = process_data(read_upload(file_bytes, filename))
+
+    # Só persiste um processamento bem-sucedido (com erro de mapeamento os DataFrames vêm vazios)
+    if not df_consolidado.empty:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            for df, path in ((df_raw, raw_path), (df_consolidado, consolidado_path)):
+                # Grava em um arquivo temporário e renomeia, para nunca deixar um Parquet pela metade;
+                # o nome do temporário é único (mkstemp), então dois processos gravando o mesmo arquivo
+                # não escrevem no mesmo temporário
+                fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as tmp_file:
+                        df.to_parquet(tmp_file, engine='pyarrow', compression='zstd')
+                    os.replace(tmp_path, path)
+                finally:
+                    # Se a gravação falhou, o temporário não fica para trás
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            # O cache em disco tem tamanho limitado (e guarda matrículas): apaga os arquivos mais antigos
+            prune_disk_cache()
+        except OSError:
+            # O cache em disco é só uma otimização: sem permissão de escrita, disco cheio etc.,
+            # os dados já processados são usados normalmente
+            pass
+
+    return df_raw, df_consolidado, chave
+
+
+def explode_options(df_pl, coluna):
+    """Expande uma coluna de múltipla escolha (valores separados por vírgula) em uma linha por opção.
+
+    Respostas idênticas são agrupadas antes do explode (a coluna tem poucas combinações distintas),
+    então só as combinações distintas são expandidas, cada uma com sua 'Contagem'.
+    """
+    # Só a coluna e a chave Disciplina entram no explode, para não replicar as demais colunas
+    # A coluna pode vir como nula ou strings vazias: um único filtro descarta as duas
+    # (a comparação com '' é nula para valores nulos, e o filter também os remove)
+    return (
+        df_pl
+        .group_by('Disciplina', coluna).agg(Contagem=pl.len())
+        .with_columns(pl.col(coluna).cast(pl.String).str.split(',').list.eval(pl.element().str.strip_chars()))
+        .explode(coluna)
+        .filter(pl.col(coluna) != '')
+    )
+
+
+def percent_counts(df_pl, coluna):
+    """Soma as opções de uma coluna por disciplina e retorna {disciplina: porcentagens} (em pandas, para o Plotly)."""
+    contagem = (
+        df_pl.group_by('Disciplina', coluna).agg(pl.col('Contagem').sum())
+        .sort(['Contagem', coluna], descending=[True, False])
+        .with_columns(Porcentagem=pl.col('Contagem') / pl.col('Contagem').sum().over('Disciplina') * 100)
+    )
+    return {
+        disciplina: df.select(coluna, 'Porcentagem').to_pandas()
+        for (disciplina,), df in contagem.partition_by('Disciplina', as_dict=True).items()
+    }
+
+
+# As funções abaixo derivam tabelas do arquivo carregado. O cache é indexado por chave_arquivo
+# (ver file_key): os argumentos com '_' não entram no hash, então o Streamlit não percorre
+# os DataFrames a cada rerun
+
+@st.cache_data
+def precompute_detail(chave_arquivo, _df_consolidado):
+    """Calcula de uma vez as porcentagens de disponibilidade e de motivação de todas as disciplinas."""
+    df_pl = pl.from_pandas(_df_consolidado[['Disciplina', 'Disponibilidade', 'Motivacao']])
+
+    disponibilidade_por_disciplina = percent_counts(explode_options(df_pl, 'Disponibilidade'), 'Disponibilidade')
+
+    df_motivacao = explode_options(df_pl, 'Motivacao')
+    df_motivacao = df_motivacao.filter(~pl.col('Motivacao').str.contains(MOTIVOS_EXCLUIR_RE))
+    motivacao_por_disciplina = percent_counts(df_motivacao, 'Motivacao')
+
+    return disponibilidade_por_disciplina, motivacao_por_disciplina
+
+
+@st.cache_data
+def compute_filter_options(chave_arquivo, _df_raw, _df_consolidado):
+    """Monta as opções dos filtros da sidebar (cursos e disciplinas)."""
+    # As colunas são categóricas: as categorias já são os valores distintos, sem varrer as linhas
+    cursos_disponiveis = ['Todos os Cursos'] + _df_raw['Curso'].cat.categories.sort_values().tolist()
+    disciplinas_com_interesse = _df_consolidado['Disciplina'].cat.categories.sort_values().tolist()
+    return cursos_disponiveis, disciplinas_com_interesse
+
+
+@st.cache_data
+def compute_full_demanda(chave_arquivo, _df_consolidado):
+    """Conta as manifestações por Curso, Disciplina e Prioridade."""
+    # dropna=False mantém as respostas sem curso, que entram no total de Todos os Cursos;
+    # sort=False evita ordenar os grupos, já que a ordem do gráfico vem do total por disciplina;
+    # a contagem cabe em int32 (metade dos bytes do int64 padrão nos filtros e somas seguintes)
+    return (
+        _df_consolidado.groupby(['Curso', 'Disciplina', 'Prioridade'], observed=True, sort=False, dropna=False)
+        .size()
+        .astype('int32')
+        .rename('Contagem')
+        .reset_index()
+    )
+
+
+# Os gráficos são objetos Figure: @st.cache_resource guarda o próprio objeto, sem serializá-lo a cada rerun
+@st.cache_resource(max_entries=FIGURAS_EM_CACHE)
+def make_top_materias_fig(demanda_disciplina, demanda_total_disciplina):
+    """Gráfico de barras empilhadas da demanda por disciplina e prioridade."""
+    fig_top_materias = px.bar(
+        demanda_disciplina,
+        x='Contagem',
+        y='Disciplina',
+        color='Prioridade',
+        orientation='h',
+        title='Demanda por Disciplina (Prioridade 1, 2 e 3)',
+        category_orders={
+            'Disciplina': demanda_total_disciplina,
+            'Prioridade': PRIORIDADES
+        },
+        color_discrete_sequence=px.colors.qualitative.Bold
+    )
+
+    fig_top_materias.update_layout(
+        xaxis_title="Número de Manifestações",
+        yaxis_title="Disciplina",
+        legend_title="Prioridade",
+        height=600,
+        yaxis={'categoryorder':'total ascending'} # Ordena o eixo Y pelo total
+    )
+    return fig_top_materias
+
+
+@st.cache_resource(max_entries=FIGURAS_EM_CACHE)
+def make_disponibilidade_fig(contagem_disponibilidade, disciplina):
+    """Gráfico de barras da porcentagem de cada turno para uma disciplina."""
+    fig_disponibilidade = px.bar(
+        contagem_disponibilidade,
+        x='Porcentagem',
+        y='Disponibilidade',
+        orientation='h',
+        color='Disponibilidade',
+        title=f"Disponibilidade para {disciplina}",
+        color_discrete_sequence=px.colors.qualitative.Vivid
+    )
+    fig_disponibilidade.update_layout(
+        xaxis_title="Porcentagem de Manifestações (%)",
+        yaxis_title="Turno",
+        showlegend=False
+    )
+    return fig_disponibilidade
+
+
+@st.cache_resource(max_entries=FIGURAS_EM_CACHE)
+def make_motivacao_fig(contagem_motivacao, disciplina):
+    """Gráfico de pizza das motivações de uma disciplina."""
+    fig_motivacao = px.pie(
+        contagem_motivacao,
+        values='Porcentagem',
+        names='Motivacao',
+        title=f"Motivações Principais para {disciplina}",
+        color_discrete_sequence=px.colors.qualitative.T10
+    )
+    fig_motivacao.update_traces(textposition='inside', textinfo='percent+label')
+    fig_motivacao.update_layout(showlegend=False)
+    return fig_motivacao
 
 # --- 2. LAYOUT E CARREGAMENTO DE DADOS COM UPLOADER ---
 st.set_page_config(layout="wide", page_title="BI de Demanda de Cursos de Férias")
@@ -82,38 +435,13 @@ with st.sidebar:
     # Inicializa DataFrames para evitar ReferenceBeforeAssignment
     df_raw = pd.DataFrame()
     df_consolidado = pd.DataFrame()
+    chave_arquivo = None
     
     if uploaded_file is not None:
         try:
-            # Lê o arquivo carregado
-            if uploaded_file.name.endswith('.csv'):
-                # Tenta detectar o separador (vírgula ou ponto e vírgula)
-                uploaded_file.seek(0)
-                file_content_bytes = uploaded_file.read()
-                
-                # Tenta decodificar com utf-8, se falhar, tenta latin-1
-                try:
-                    file_content = file_content_bytes.decode('utf-8')
-                except UnicodeDecodeError:
-                    uploaded_file.seek(0)
-                    file_content = file_content_bytes.decode('latin-1')
-
-                separator = ',' if file_content.count(',') > file_content.count(';') else ';'
-                
-                # Retorna ao início do buffer para o pandas ler
-                uploaded_file.seek(0)
-                
-                # Tenta ler com o encoding que funcionou
-                try:
-                    df_load = pd.read_csv(uploaded_file, sep=separator, encoding='utf-8')
-                except UnicodeDecodeError:
-                    uploaded_file.seek(0)
-                    df_load = pd.read_csv(uploaded_file, sep=separator, encoding='latin-1')
-                    
-            else: # Assumindo xlsx
-                df_load = pd.read_excel(uploaded_file)
-                
-            df_raw, df_consolidado = process_data(df_load)
+            # Lê e processa o arquivo carregado (em cache pelos bytes do arquivo); a chave usada pelos
+            # caches das tabelas derivadas vem do mesmo cache, sem recalcular o SHA-256 a cada rerun
+            df_raw, df_consolidado, chave_arquivo = load_and_process(uploaded_file.getvalue(), uploaded_file.name)
             st.success("Dados carregados e processados com sucesso!")
             
         except Exception as e:
@@ -130,10 +458,8 @@ if df_consolidado is None or df_consolidado.empty:
     st.stop() 
 
 
-# Opções de Cursos para filtro global
-cursos_disponiveis = ['Todos os Cursos'] + sorted(df_raw['Curso'].unique().tolist())
-# Opções de Disciplinas para o filtro de detalhes (P2 e P3)
-disciplinas_com_interesse = sorted(df_consolidado['Disciplina'].unique().tolist())
+# Opções de Cursos para filtro global e de Disciplinas para o filtro de detalhes (P2 e P3)
+cursos_disponiveis, disciplinas_com_interesse = compute_filter_options(chave_arquivo, df_raw, df_consolidado)
 
 # Filtros após o carregamento
 curso_selecionado = st.sidebar.selectbox(
@@ -141,6 +467,9 @@ curso_selecionado = st.sidebar.selectbox(
     cursos_disponiveis
 )
 
+# Quantidade de disciplinas no gráfico de Top Matérias (a cauda de baixa demanda fica de fora)
+top_n = st.sidebar.slider("Top N disciplinas (Análise Top Matérias):", 5, 50, 20)
+
 # Adiciona a verificação para garantir que há disciplinas disponíveis para seleção
 if disciplinas_com_interesse:
     disciplina_detalhe = st.sidebar.selectbox(
@@ -152,128 +481,85 @@ else:
     st.stop()
 
 
-# --- 3. IMPLEMENTAÇÃO DA ANÁLISE 1: TOP MATÉRIAS ---
-st.header("1. Top Matérias - Demanda Consolidada")
-
-# Filtragem Dinâmica por Curso
-if curso_selecionado != 'Todos os Cursos':
-    df_filtrado = df_consolidado[df_consolidado['Curso'] == curso_selecionado]
-    st.info(f"Mostrando a demanda consolidada (P1, P2 e P3) para o curso de **{curso_selecionado}**.")
-else:
-    df_filtrado = df_consolidado
-    st.info("Mostrando a demanda consolidada (P1, P2 e P3) para **Todos os Cursos**.")
-
-# Verifica se o DataFrame filtrado não está vazio
-if df_filtrado.empty:
-    st.warning(f"Não há dados para o curso selecionado: {curso_selecionado}")
-    # Usa st.markdown em vez de st.stop() para manter o layout (se houver dados não-filtrados)
-    pass 
-else:
-    # Contagem e visualização
-    demanda_disciplina = df_filtrado.groupby(['Disciplina', 'Prioridade']).size().reset_index(name='Contagem')
-    demanda_total_disciplina = demanda_disciplina.groupby('Disciplina')['Contagem'].sum().sort_values(ascending=False).index.tolist()
-
-    # Garante que as Top Matérias sejam as primeiras
-    demanda_disciplina['Disciplina'] = pd.Categorical(demanda_disciplina['Disciplina'], categories=demanda_total_disciplina, ordered=True)
-    demanda_disciplina = demanda_disciplina.sort_values('Disciplina')
+# Cada análise fica em uma aba. Com on_change="rerun" as abas guardam o estado (.open) e só a aba
+# selecionada calcula as tabelas e monta os gráficos; a troca de aba dispara um novo rerun
+aba_top_materias, aba_detalhes = st.tabs(
+    ["1. Top Matérias", "Detalhes da Disciplina"], on_change="rerun", key="aba_analise"
+)
 
-    # Criação do gráfico de barras empilhadas com Plotly
-    fig_top_materias = px.bar(
-        demanda_disciplina,
-        x='Contagem',
-        y='Disciplina',
-        color='Prioridade',
-        orientation='h',
-        title='Demanda por Disciplina (Prioridade 1, 2 e 3)',
-        category_orders={'Prioridade': ['Prioridade 1', 'Prioridade 2', 'Prioridade 3']},
-        color_discrete_sequence=px.colors.qualitative.Bold
-    )
+# --- 3. IMPLEMENTAÇÃO DA ANÁLISE 1: TOP MATÉRIAS ---
+if aba_top_materias.open:
+    with aba_top_materias:
+        st.header("1. Top Matérias - Demanda Consolidada")
+
+        # Contagem por Curso, Disciplina e Prioridade calculada uma única vez (em cache);
+        # a filtragem por curso é só um recorte dessa tabela pequena
+        demanda_completa = compute_full_demanda(chave_arquivo, df_consolidado)
+
+        # Filtragem Dinâmica por Curso
+        if curso_selecionado != 'Todos os Cursos':
+            demanda_disciplina = demanda_completa[demanda_completa['Curso'] == curso_selecionado]
+            st.info(f"Mostrando a demanda consolidada (P1, P2 e P3) para o curso de **{curso_selecionado}**.")
+        else:
+            # Soma a contagem de todos os cursos
+            demanda_disciplina = demanda_completa.groupby(['Disciplina', 'Prioridade'], observed=True, sort=False)['Contagem'].sum().reset_index()
+            st.info("Mostrando a demanda consolidada (P1, P2 e P3) para **Todos os Cursos**.")
+
+        # Verifica se a contagem filtrada não está vazia
+        if demanda_disciplina.empty:
+            st.warning(f"Não há dados para o curso selecionado: {curso_selecionado}")
+            # Usa st.markdown em vez de st.stop() para manter o layout (se houver dados não-filtrados)
+            pass 
+        else:
+            # Total por disciplina levado de volta às linhas com transform (sem uma segunda tabela para juntar)
+            demanda_disciplina = demanda_disciplina.assign(**{
+                'Contagem Total': demanda_disciplina.groupby('Disciplina', sort=False, observed=True)['Contagem'].transform('sum')
+            })
+            # Ordem das Top Matérias pelo total, repassada ao Plotly (sem reordenar o DataFrame);
+            # nlargest seleciona só as top_n disciplinas, sem ordenar a lista inteira
+            demanda_total_disciplina = demanda_disciplina.drop_duplicates('Disciplina').nlargest(top_n, 'Contagem Total')['Disciplina'].tolist()
+            # Só as linhas das disciplinas selecionadas vão para o gráfico
+            demanda_disciplina = demanda_disciplina[demanda_disciplina['Disciplina'].isin(demanda_total_disciplina)]
+
+            # Criação do gráfico de barras empilhadas com Plotly (em cache)
+            fig_top_materias = make_top_materias_fig(demanda_disciplina, demanda_total_disciplina)
+            st.plotly_chart(fig_top_materias, use_container_width=True)
 
-    fig_top_materias.update_layout(
-        xaxis_title="Número de Manifestações",
-        yaxis_title="Disciplina",
-        legend_title="Prioridade",
-        height=600,
-        yaxis={'categoryorder':'total ascending'} # Ordena o eixo Y pelo total
-    )
-    st.plotly_chart(fig_top_materias, use_container_width=True)
 
 # --- 4. IMPLEMENTAÇÃO DAS ANÁLISES 2 E 3 (DETALHES POR MATÉRIA) ---
-st.markdown("---")
-st.header(f"Detalhes da Disciplina: {disciplina_detalhe}")
-
-col1, col2 = st.columns(2)
+if aba_detalhes.open:
+    with aba_detalhes:
+        st.header(f"Detalhes da Disciplina: {disciplina_detalhe}")
 
-# Filtrar o DataFrame apenas para a disciplina selecionada
-df_detalhe = df_consolidado[df_consolidado['Disciplina'] == disciplina_detalhe]
+        col1, col2 = st.columns(2)
 
-if df_detalhe.empty:
-    st.warning(f"Não há detalhes para a disciplina: {disciplina_detalhe}")
-    st.stop()
+        # Tabelas de todas as disciplinas calculadas uma única vez; a disciplina selecionada é só uma consulta
+        disponibilidade_por_disciplina, motivacao_por_disciplina = precompute_detail(chave_arquivo, df_consolidado)
 
-# --- ANÁLISE 2: DISPONIBILIDADE POR MATÉRIA ---
-with col1:
-    st.subheader("2. Disponibilidade de Turnos")
+        # --- ANÁLISE 2: DISPONIBILIDADE POR MATÉRIA ---
+        with col1:
+            st.subheader("2. Disponibilidade de Turnos")
     
-    # 1. Expandir (explode) a coluna de Disponibilidade (que é CSV)
-    # A coluna de disponibilidade pode vir como NaN ou strings vazias, então filtramos
-    df_disponibilidade = df_detalhe.dropna(subset=['Disponibilidade']).assign(Disponibilidade=df_detalhe['Disponibilidade'].str.split(',\s*')).explode('Disponibilidade')
-    df_disponibilidade['Disponibilidade'] = df_disponibilidade['Disponibilidade'].str.strip()
+            # 1. Porcentagem de cada turno (a coluna de Disponibilidade já foi expandida e contada)
+            contagem_disponibilidade = disponibilidade_por_disciplina.get(disciplina_detalhe, pd.DataFrame())
     
-    # 2. Contar e calcular porcentagem
-    contagem_disponibilidade = df_disponibilidade['Disponibilidade'].value_counts(normalize=True).mul(100).rename('Porcentagem').reset_index()
+            # 2. Criar o gráfico
+            if not contagem_disponibilidade.empty:
+                fig_disponibilidade = make_disponibilidade_fig(contagem_disponibilidade, disciplina_detalhe)
+                st.plotly_chart(fig_disponibilidade, use_container_width=True)
+            else:
+                st.warning(f"Nenhuma disponibilidade registrada para {disciplina_detalhe}.")
+
+        # --- ANÁLISE 3: MOTIVAÇÕES POR MATÉRIA ---
+        with col2:
+            st.subheader("3. Motivações (Excluindo Outros/Não Interesse)")
+
+            # 1. Porcentagem de cada motivação (já expandida, sem os motivos não desejados)
+            contagem_motivacao = motivacao_por_disciplina.get(disciplina_detalhe, pd.DataFrame())
     
-    # 3. Criar o gráfico
-    if not contagem_disponibilidade.empty:
-        fig_disponibilidade = px.bar(
-            contagem_disponibilidade,
-            x='Porcentagem',
-            y='Disponibilidade',
-            orientation='h',
-            color='Disponibilidade',
-            title=f"Disponibilidade para {disciplina_detalhe}",
-            color_discrete_sequence=px.colors.qualitative.Vivid
-        )
-        fig_disponibilidade.update_layout(
-            xaxis_title="Porcentagem de Manifestações (%)",
-            yaxis_title="Turno",
-            showlegend=False
-        )
-        st.plotly_chart(fig_disponibilidade, use_container_width=True)
-    else:
-        st.warning(f"Nenhuma disponibilidade registrada para {disciplina_detalhe}.")
-
-# --- ANÁLISE 3: MOTIVAÇÕES POR MATÉRIA ---
-with col2:
-    st.subheader("3. Motivações (Excluindo Outros/Não Interesse)")
-
-    # 1. Expandir (explode) a coluna de Motivação (que é CSV)
-    df_motivacao = df_detalhe.dropna(subset=['Motivacao']).assign(Motivacao=df_detalhe['Motivacao'].str.split(',\s*')).explode('Motivacao')
-    df_motivacao['Motivacao'] = df_motivacao['Motivacao'].str.strip()
-    
-    # 2. Filtrar os motivos não desejados (ajustado para termos em português)
-    motivos_excluir = [
-        'outros', 'outro', 'não tenho interesse', 
-        'há outros fatores que motiva seu interesse em cursar essas disciplinas nas férias? há mais alguma observação que gostaria de compartilhar?',
-        'opcional. ex: "não posso ter aulas em fevereiro", "troquei de matriz e agora tá bem complicado pois..." , "tenho preferencia pelo professor(a) tal, mas dependendo também poderia com tal", "não tenho preferencia por horário e professor, estou desesperado(a)!".'
-    ] 
-    
-    df_motivacao_filtrada = df_motivacao[~df_motivacao['Motivacao'].str.lower().isin(motivos_excluir)]
-    
-    # 3. Contar e calcular porcentagem
-    contagem_motivacao = df_motivacao_filtrada['Motivacao'].value_counts(normalize=True).mul(100).rename('Porcentagem').reset_index()
-    
-    # 4. Criar o gráfico
-    if not contagem_motivacao.empty:
-        fig_motivacao = px.pie(
-            contagem_motivacao,
-            values='Porcentagem',
-            names='Motivacao',
-            title=f"Motivações Principais para {disciplina_detalhe}",
-            color_discrete_sequence=px.colors.qualitative.T10
-        )
-        fig_motivacao.update_traces(textposition='inside', textinfo='percent+label')
-        fig_motivacao.update_layout(showlegend=False)
-        st.plotly_chart(fig_motivacao, use_container_width=True)
-    else:
-        st.warning("Não há motivos válidos (excluindo genéricos) para esta disciplina.")
+            # 2. Criar o gráfico
+            if not contagem_motivacao.empty:
+                fig_motivacao = make_motivacao_fig(contagem_motivacao, disciplina_detalhe)
+                st.plotly_chart(fig_motivacao, use_container_width=True)
+            else:
+                st.warning("Não há motivos válidos (excluindo genéricos) para esta disciplina.")